@@ -1,26 +1,110 @@
 import streamlit as st
 import pandas as pd
-import google.generativeai as genai
-import plotly.express as px
-import requests
+import numpy as np
+from google.ai import generativelanguage as glm
+from google.api_core.exceptions import ResourceExhausted
+import plotly.io as pio
+import json
 import re
+import hashlib
+import time
+import io
 import os
-import pdfplumber
-import random
-from colorthief import ColorThief
-
-# Loading API key from Streamlit Secrets
-API_KEY = st.secrets["GEMINI_API_KEY"]
-
-# Gemni Configuration
-genai.configure(api_key=API_KEY)
-model = genai.GenerativeModel("gemini-1.5-pro-latest")
+import pathlib
+import multiprocessing
+import threading
+from PIL import Image
+import viz_runner
+import data_io
+
+# Loading API keys from Streamlit Secrets (GEMINI_API_KEYS for a pool, GEMINI_API_KEY for a single key)
+gemini_keys = st.secrets.get("GEMINI_API_KEYS") or st.secrets["GEMINI_API_KEY"]
+API_KEYS = [gemini_keys] if isinstance(gemini_keys, str) else list(gemini_keys)
+
+# Seconds a rate-limited key is skipped before it is tried again
+KEY_COOLDOWN = 60
+
+# Gemini model used for code generation
+GEMINI_MODEL = "models/gemini-1.5-pro-latest"
+
+# Gemni Configuration, one client per API key, created once per process instead of on every rerun.
+# The generativelanguage client is used directly: each client carries its own key, with no global state.
+@st.cache_resource
+def get_client(key):
+    return glm.GenerativeServiceClient(client_options={"api_key": key})
+
+# Stream a response for a single-turn prompt
+def stream_generate(key, prompt):
+    request = glm.GenerateContentRequest(
+        model=GEMINI_MODEL, contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])]
+    )
+    return get_client(key).stream_generate_content(request=request)
+
+# Thread-safe pool of Gemini API keys: least recently used first, rate-limited keys cool down
+class KeyPool:
+    def __init__(self, keys, cooldown=KEY_COOLDOWN):
+        self.keys = list(keys)
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.last_used = {key: 0.0 for key in self.keys}
+        self.cooling_until = {key: 0.0 for key in self.keys}
+
+    def acquire(self):
+        with self.lock:
+            now = time.time()
+            ready = [key for key in self.keys if self.cooling_until[key] <= now]
+            if not ready:
+                raise ResourceExhausted("All Gemini API keys are rate limited")
+            key = min(ready, key=self.last_used.get)
+            self.last_used[key] = now
+            return key
+
+    def mark_exhausted(self, key):
+        with self.lock:
+            self.cooling_until[key] = time.time() + self.cooldown
+
+# One key pool per process, shared by every session
+@st.cache_resource
+def get_key_pool():
+    return KeyPool(API_KEYS)
+
+# A closing Markdown fence: ``` alone on its line (a ``` inside a string literal doesn't count)
+CLOSING_FENCE = re.compile(r"^[ \t]*```[ \t]*$", re.MULTILINE)
+
+# Collect a streamed Gemini response, stopping as soon as the fenced code block is closed
+def read_code_stream(stream):
+    text = ""
+    for chunk in stream:
+        # Chunks without parts (e.g. the final STOP chunk) carry no text
+        parts = chunk.candidates[0].content.parts if chunk.candidates else []
+        if not parts:
+            continue
+        text += "".join(part.text for part in parts)
+
+        # Cut at the end of the closing fence line; prose after it may share the chunk
+        if text.lstrip().startswith("```"):
+            body_start = text.find("\n", text.find("```")) + 1
+            closing = CLOSING_FENCE.search(text, body_start) if body_start else None
+            if closing:
+                return text[:closing.end()]
+    return text
+
+# Call Gemini with the next available key, moving on to another key on a 429
+def generate_with_key_pool(prompt):
+    pool = get_key_pool()
+    for _ in range(len(pool.keys)):
+        key = pool.acquire()
+        try:
+            return read_code_stream(stream_generate(key, prompt))
+        except ResourceExhausted:
+            pool.mark_exhausted(key)
+    raise ResourceExhausted("All Gemini API keys are rate limited")
 
 # Title
 st.image("Logo1(BearViz).png", width=300)
 st.markdown("### Transform data into insights, effortlessly!")
 # File Upload
-uploaded_file = st.file_uploader("Upload **CSV**, **Excel**, **TXT**, or **PDF** File", type=["csv", "xlsx", "txt", "pdf"])
+uploaded_file = st.file_uploader("Upload **CSV**, **Excel**, **TXT**, **Parquet**, or **PDF** File", type=["csv", "xlsx", "txt", "parquet", "pdf"])
 
 # API Data Fetching
 api_url = st.text_input("Enter **API URL** for Live Data")
@@ -28,78 +112,242 @@ api_url = st.text_input("Enter **API URL** for Live Data")
 # Image Upload for Color Extraction
 uploaded_image = st.file_uploader("Upload an **Image** for Color Theme (Optional)", type=["png", "jpg", "jpeg"])
 
-# Extract Colors & Generate Additional Colors
-def extract_colors(image, required_colors):
-    color_thief = ColorThief(image)
-    extracted_colors = color_thief.get_palette(color_count=min(required_colors, 10))
-    extracted_hex = ["#{:02x}{:02x}{:02x}".format(*color) for color in extracted_colors]
+# Palette extraction only needs a small image; colour distribution survives downscaling
+PALETTE_IMAGE_SIZE = (256, 256)
+
+# Two-character hex strings for every byte value, used to format a whole palette at once
+HEX_LUT = np.array([f"{i:02x}" for i in range(256)])
+
+# Format an (N, 3) uint8 RGB array as "#rrggbb" strings
+def rgb_to_hex(rgb):
+    return np.char.add("#", np.char.add(np.char.add(HEX_LUT[rgb[:, 0]], HEX_LUT[rgb[:, 1]]), HEX_LUT[rgb[:, 2]])).tolist()
+
+# Extract Colors & Generate Additional Colors (cached on the image bytes)
+@st.cache_data(show_spinner=False)
+def extract_colors(image_bytes, required_colors):
+    from colorthief import ColorThief
+
+    img = Image.open(io.BytesIO(image_bytes))
+    img.thumbnail(PALETTE_IMAGE_SIZE, Image.Resampling.BILINEAR)
+    buf = io.BytesIO()
+    img.convert("RGBA").save(buf, "PNG")  # Keep alpha: ColorThief skips transparent pixels instead of counting them as black
+    buf.seek(0)
+
+    color_thief = ColorThief(buf)
+    extracted_colors = np.asarray(color_thief.get_palette(color_count=min(required_colors, 10)), dtype=np.uint8)
 
-    # If more colors are needed, Generate colors
-    while len(extracted_hex) < required_colors:
-        base_color = extracted_hex[len(extracted_hex) % len(extracted_hex)]
-        new_color = "#{:02x}{:02x}{:02x}".format(
-            (int(base_color[1:3], 16) + random.randint(20, 50)) % 256,
-            (int(base_color[3:5], 16) + random.randint(20, 50)) % 256,
-            (int(base_color[5:7], 16) + random.randint(20, 50)) % 256
-        )
-        extracted_hex.append(new_color)
+    # If more colors are needed, Generate colors (all at once, cycling through the extracted ones as bases)
+    needed = required_colors - len(extracted_colors)
+    if needed > 0:
+        offsets = np.random.default_rng().integers(20, 51, size=(needed, 3))
+        bases = extracted_colors[np.arange(needed) % len(extracted_colors)]
+        new_colors = (bases.astype(np.int16) + offsets) % 256
+        extracted_colors = np.vstack([extracted_colors, new_colors.astype(np.uint8)])
 
-    return extracted_hex[:required_colors]
+    return rgb_to_hex(extracted_colors[:required_colors])
 
 # Default Color Palette
 color_palette = st.session_state.get("color_palette", ["#3498db", "#e74c3c", "#2ecc71", "#f1c40f", "#9b59b6"])
 
 if uploaded_image:
     required_colors = 8
-    color_palette = extract_colors(uploaded_image, required_colors)
-    st.session_state["color_palette"] = color_palette
+
+    # Only re-extract when a different image is uploaded
+    if st.session_state.get("palette_image_id") != uploaded_image.file_id:
+        color_palette = extract_colors(uploaded_image.getvalue(), required_colors)
+        st.session_state["color_palette"] = color_palette
+        st.session_state["palette_image_id"] = uploaded_image.file_id
+
+        # Build the swatch HTML once per palette
+        color_html = "".join([
+            f"<div style='width: 40px; height: 40px; display: inline-block; margin: 5px; background-color: {color}; border-radius: 5px;'></div>"
+            for color in color_palette
+        ])
+        st.session_state["swatch_html"] = f"<div style='display: flex;'>{color_html}</div>"
 
     st.write("🎨 **Extracted Colors:**")
-    color_html = "".join(
-        f"<div style='width: 40px; height: 40px; display: inline-block; margin: 5px; background-color: {color}; border-radius: 5px;'></div>"
-        for color in color_palette
-    )
-    st.markdown(f"<div style='display: flex;'>{color_html}</div>", unsafe_allow_html=True)
+    st.markdown(st.session_state["swatch_html"], unsafe_allow_html=True)
+
+# Saved datasets untouched for this long are deleted from data/ (every Generate click touches its file)
+DATA_MAX_AGE = 24 * 60 * 60
+
+# Delete datasets (and leftover temporary files) that no session has used for DATA_MAX_AGE
+def prune_data_dir():
+    cutoff = time.time() - DATA_MAX_AGE
+    for entry in os.scandir("data"):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass  # Another session pruned it first
+
+# Whether a dataset is already on disk; refreshes its age so pruning keeps it while it is in use
+def is_saved(file_path):
+    try:
+        os.utime(file_path)
+        return True
+    except FileNotFoundError:
+        return False
+
+# Run a file write on a background thread so the disk I/O overlaps the Gemini call.
+# The file is written under a temporary name and renamed, so other sessions never read it half-written.
+def write_in_background(write, file_path):
+    os.makedirs("data", exist_ok=True)
+
+    def write_atomically(path):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+        prune_data_dir()
+
+    writer = threading.Thread(target=write_atomically, args=(file_path,), daemon=True)
+    writer.start()
+    return writer
+
+# Write the upload to disk for the generated script (returns the writer thread, if any).
+# The path is named after the content hash, so identical uploads share one file and different ones never collide.
+def save_upload(uploaded_file, file_path):
+    if not is_saved(file_path):
+        return write_in_background(lambda path: pathlib.Path(path).write_bytes(uploaded_file.getbuffer()), file_path)
+    return None
+
+# Write the fetched API data to disk for the generated script, once per fetch (returns the writer thread, if any).
+# Snapshots are per session, so the one from this session's previous fetch is deleted.
+def save_snapshot(df, file_path):
+    if is_saved(file_path):
+        return None
+    previous_path = st.session_state.get("snapshot_path")
+    if previous_path and previous_path != file_path:
+        try:
+            os.remove(previous_path)
+        except FileNotFoundError:
+            pass
+    st.session_state["snapshot_path"] = file_path
+    return write_in_background(lambda path: df.to_parquet(path, index=False, compression="snappy"), file_path)
 
 # Load Data from File or API
 df = None
 file_name = None
 
+# Keep the loaded DataFrame across reruns; a new upload or API URL invalidates it and the last chart
+source_key = uploaded_file.file_id if uploaded_file else api_url
+if st.session_state.get("source_key") != source_key:
+    st.session_state["source_key"] = source_key
+    for key in ("df", "df_loaded_at", "file_hash", "preview", "last_fig"):
+        st.session_state.pop(key, None)
+
 if uploaded_file:
     file_name = uploaded_file.name
-    file_path = os.path.join("data", file_name)
-    os.makedirs("data", exist_ok=True)
-
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-
-    if file_name.endswith(".csv"):
-        df = pd.read_csv(file_path)
-    elif file_name.endswith((".xlsx", ".xls")):
-        df = pd.read_excel(file_path)
-    elif file_name.endswith(".txt"):
-        df = pd.read_csv(file_path, delimiter="\t", encoding="utf-8", on_bad_lines="skip")
-    elif file_name.endswith(".pdf"):
-        with pdfplumber.open(file_path) as pdf:
-            all_text = "\n".join([page.extract_text() for page in pdf.pages if page.extract_text()])
-        df = pd.DataFrame({"Extracted_Text": all_text.split("\n")})  # Convert text into DataFrame
+    if "df" not in st.session_state:
+        file_bytes = uploaded_file.getvalue()
+        st.session_state["file_hash"] = data_io.hash_bytes(file_bytes)
+        st.session_state["df"] = data_io.load_dataframe(file_name, st.session_state["file_hash"], file_bytes)
+    file_path = os.path.join("data", st.session_state["file_hash"] + os.path.splitext(file_name)[1].lower())
+    df = st.session_state["df"]
 
 elif api_url:
     try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        df = pd.DataFrame(response.json())
-        file_name = "live_data.csv"
+        if "df" not in st.session_state or time.time() - st.session_state["df_loaded_at"] > data_io.API_CACHE_TTL:
+            st.session_state["df"] = data_io.fetch_api(api_url)
+            st.session_state["df_loaded_at"] = time.time()
+            st.session_state.pop("preview", None)
+
+        # One snapshot per URL and fetch, so sessions on other URLs or fetches never overwrite it
+        snapshot_key = data_io.hash_bytes(f"{api_url}|{st.session_state['df_loaded_at']}".encode())
+        file_name = f"live_{snapshot_key}.parquet"
         file_path = os.path.join("data", file_name)
-        df.to_csv(file_path, index=False)
+        df = st.session_state["df"]
     except Exception as e:
         print(f"\n ❌ API Fetch Failed: {e}")
         st.error("⚠️ Error processing the uploaded dataset. Ensure it is in a valid format and try again.")
 
+# Remove the Markdown code fence Gemini wraps around scripts
+def strip_code_fences(text):
+    code = text.strip().removeprefix("```python").removeprefix("```").removesuffix("```").strip()
+
+    # Gemini sometimes drops the backticks but keeps the language tag on its own line
+    first_line, _, rest = code.partition("\n")
+    return rest.lstrip() if first_line.strip() == "python" else code
+
+# Generate code with Gemini, persisted on disk and keyed on the prompt hash
+@st.cache_data(persist="disk", show_spinner=False)
+def gen_code(prompt_hash, _prompt):
+    response_text = generate_with_key_pool(_prompt)
+
+    # Ensure the response contains valid code (raising keeps bad responses out of the cache)
+    if not response_text or not response_text.strip():
+        print("\n ❌ Gemini AI did not return valid Python code.")
+        raise ValueError("Gemini AI did not return valid Python code.")
+
+    # Clean unwanted Markdown formatting once per response, before it is cached
+    return strip_code_fences(response_text)
+
+# Scatter/line charts above this many points are rendered with WebGL (plotly.js SVG slows past a few thousand)
+WEBGL_MIN_ROWS = 1_000
+
+# Larger datasets are sampled/aggregated before plotting; more points than pixels is wasted work
+PLOT_MAX_ROWS = 200_000
+
+# Columns described in the prompt; fewer input tokens means a faster Gemini response
+SUMMARY_MAX_COLUMNS = 20
+
+# Compact per-column schema for the prompt (cached per DataFrame and question)
+@st.cache_data(show_spinner=False)
+def summarize_dataframe(df, problem_statement):
+    df = data_io.optimize_dtypes(df)
+
+    # Columns named in the question go first so they survive the column cap
+    # (whole-word matches only, so short names like "id" or "x" don't match inside other words)
+    question = problem_statement.lower()
+    mentioned = [col for col in df.columns if re.search(rf"(?<!\w){re.escape(str(col).lower())}(?!\w)", question)]
+    columns = mentioned + [col for col in df.columns if col not in mentioned]
+
+    schema = []
+    for col in columns[:SUMMARY_MAX_COLUMNS]:
+        series = df[col]
+        entry = {"col": col, "dtype": str(series.dtype)}
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+            entry["min"], entry["max"] = series.min(), series.max()
+        else:
+            try:
+                entry["nunique"] = int(series.nunique())
+            except (TypeError, NotImplementedError):
+                pass  # List/dict values (object or Arrow list/struct columns) can't be counted; the dtype is enough
+        schema.append(entry)
+    return f"Shape: {df.shape}\nColumns: {json.dumps(schema, default=str)}"
+
+SCRIPT_TIMEOUT = 30
+
+# One long-lived worker process with pandas/plotly preloaded, shared across reruns
+@st.cache_resource
+def get_script_pool():
+    return data_io.WORKER_CONTEXT.Pool(processes=1, initializer=viz_runner.preload)
+
+# Sessions take turns on the worker, so the timeout only counts a script's own run time
+# and a timeout can only ever kill the script that caused it
+@st.cache_resource
+def get_script_lock():
+    return threading.Lock()
+
+# Run the generated code isolated from the app process and rebuild its figure
+def run_generated_script(generated_code, script_path):
+    with get_script_lock():
+        pool = get_script_pool()
+        try:
+            fig_json = pool.apply_async(viz_runner.run_code, (generated_code, script_path)).get(timeout=SCRIPT_TIMEOUT)
+        except multiprocessing.TimeoutError:
+            # Runaway code: kill the worker so the next run gets a fresh one
+            pool.terminate()
+            get_script_pool.clear()
+            raise
+    return pio.from_json(fig_json) if fig_json is not None else None
+
 # Analyse and display loaded Data
-if df is not None and not df.empty:
+if df is not None and len(df):
     st.write("### Dataset Preview")
-    st.dataframe(df.head())
+    if "preview" not in st.session_state:
+        st.session_state["preview"] = df.head()
+    st.dataframe(st.session_state["preview"])
 
     # Prompt the Problem statement
     problem_statement = st.text_input("What do you want to analyze?", "Example: Sales trend over time")
@@ -107,40 +355,47 @@ if df is not None and not df.empty:
     if st.button("Generate Visualization"):
         st.write("📊 Creating your interactive chart...")
 
-        # Generate Visualization Using Gemini
-        query = f"""
-        Given this dataset summary:
-        {df.describe().to_string()}
-
-        The user wants to analyze: "{problem_statement}"
-
-        The dataset file is: "{file_path}" (use this exact filename in the code)
-
-        Generate a **Python script** that:
-        - Loads the dataset using pandas
-        - Uses **Plotly** to create an **interactive visualization**
-        - Enables **hover tooltips** with dynamically relevant units (like currency, count, percentage)
-        - Uses `plotly.express` and **returns a `fig` object instead of saving an image**
-        - Uses the given color palette: {color_palette}
-        - **Do NOT save the figure as an image**; just return `fig`
-        - Do NOT assume a generic file name like 'dataset.csv'. Use "{file_path}" exactly.
-        - Do NOT include explanations or Markdown formatting, only return runnable Python code.
-        """
+        # The generated script reads the dataset from disk; it is written while Gemini works
+        if uploaded_file:
+            writer = save_upload(uploaded_file, file_path)
+        else:
+            writer = save_snapshot(df, file_path)
 
+        prompt_hash = None
         try:
-            response = model.generate_content(query)
-
-            # Ensure the response contains valid code
-            if not response or not hasattr(response, "text") or not response.text.strip():
-                print("\n ❌ Gemini AI did not return valid Python code.")
-                st.error("⚠️ Our servers are currently experiencing high traffic. Please try again later.")
-                st.stop()
-
-            generated_code = response.text.strip()
-
-            # Clean unwanted Markdown formatting
-            generated_code = re.sub(r"^```python", "", generated_code, flags=re.MULTILINE)
-            generated_code = re.sub(r"```$", "", generated_code, flags=re.MULTILINE)
+            # Large datasets need a scalable rendering backend
+            backend_hint = ""
+            if len(df) > WEBGL_MIN_ROWS:
+                backend_hint = f"- If the chart is a scatter/line with more than {WEBGL_MIN_ROWS} points, set `render_mode='webgl'` (or use `go.Scattergl`) for GPU-accelerated rendering"
+            if len(df) > PLOT_MAX_ROWS:
+                backend_hint += (
+                    f"\n            - Right after loading, downsample with `if len(df) > {PLOT_MAX_ROWS}: df = df.sample({PLOT_MAX_ROWS}, random_state=0)`;"
+                    " for time series, instead resample to a coarser frequency (e.g. `df.set_index(time_col).resample('1h').mean()`)"
+                )
+
+            # Generate Visualization Using Gemini
+            query = f"""
+            Given this dataset summary:
+            {summarize_dataframe(df, problem_statement)}
+
+            The user wants to analyze: "{problem_statement}"
+
+            The dataset file is: "{file_path}" (use this exact filename in the code)
+
+            Generate a **Python script** that:
+            - Loads the dataset using pandas{" (`pd.read_parquet`)" if file_path.endswith(".parquet") else ""}
+            - Uses **Plotly** to create an **interactive visualization**
+            - Enables **hover tooltips** with dynamically relevant units (like currency, count, percentage)
+            - Uses `plotly.express` and **returns a `fig` object instead of saving an image**
+            - Uses the given color palette: {color_palette}
+            {backend_hint}
+            - **Do NOT save the figure as an image**; just return `fig`
+            - Do NOT assume a generic file name like 'dataset.csv'. Use "{file_path}" exactly.
+            - Do NOT include explanations or Markdown formatting, only return runnable Python code.
+            """
+
+            prompt_hash = hashlib.sha256(query.encode()).hexdigest()
+            generated_code = gen_code(prompt_hash, query)
 
             # Generated code for debugging
             print("\n Generated Python Code:\n", generated_code)
@@ -150,18 +405,26 @@ if df is not None and not df.empty:
             with open(script_path, "w", encoding="utf-8") as f:
                 f.write(generated_code)
 
-            # Execute the script & retrieve the Plotly figure
-            local_vars = {}
-            exec(generated_code, globals(), local_vars)
+            # Execute the code in the preloaded worker process & retrieve the Plotly figure
+            if writer is not None:
+                writer.join()
+            fig = run_generated_script(generated_code, script_path)
 
-            # Extract `fig` from the executed script
-            if "fig" in local_vars:
-                st.plotly_chart(local_vars["fig"], use_container_width=True)
+            if fig is not None:
+                st.session_state["last_fig"] = fig
             else:
+                # Drop the cached code so the next click asks Gemini again instead of replaying it
+                gen_code.clear(prompt_hash, query)
                 print("\n ❌ The generated code did not return a valid Plotly figure.")
                 st.error("⚠️ The requested chart is invalid. Please try again with different inputs.")
 
         except Exception as e:
+            if prompt_hash is not None:
+                gen_code.clear(prompt_hash, query)
             print(f"\n ❌ Error generating visualization: {e}")
             st.error("⚠️ Our servers are currently experiencing high traffic. Please try again later.")
-            
\ No newline at end of file
+            
+
+    # Keep showing the last chart across reruns without calling Gemini again
+    if "last_fig" in st.session_state:
+        st.plotly_chart(st.session_state["last_fig"], use_container_width=True)
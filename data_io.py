@@ -0,0 +1,141 @@
+import io
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import orjson
+import pandas as pd
+import pyarrow as pa
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import streamlit as st
+import xxhash
+import pdf_runner
+
+# Start method for worker processes. Forking the threaded Streamlit server can deadlock a child
+# (and is deprecated from Python 3.12), so use a fork server where available and spawn elsewhere.
+WORKER_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+# PDFs with fewer pages are extracted in-process; process start-up would outweigh the gain.
+# A forkserver/spawn worker costs ~0.06-0.15 s to start plus the pdfplumber import and a re-parse
+# of the document, against roughly 25-50 ms of pdfminer work per page.
+PDF_PARALLEL_MIN_PAGES = 16
+
+# Extract text lines from a PDF (cached separately from the DataFrame)
+@st.cache_data(show_spinner=False, max_entries=8)
+def extract_pdf_text(file_hash, _data):
+    import pdfplumber
+
+    with pdfplumber.open(io.BytesIO(_data)) as pdf:
+        num_pages = len(pdf.pages)
+        if num_pages < PDF_PARALLEL_MIN_PAGES:
+            texts = [page.extract_text() or "" for page in pdf.pages]
+
+    # pdfminer is pure Python, so large PDFs are split into page ranges across processes
+    if num_pages >= PDF_PARALLEL_MIN_PAGES:
+        workers = min(os.cpu_count() or 1, num_pages)
+        starts = [num_pages * i // workers for i in range(workers)]
+        stops = starts[1:] + [num_pages]
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=WORKER_CONTEXT,
+            initializer=pdf_runner.load_pdf, initargs=(_data,)
+        ) as executor:
+            texts = [text for chunk in executor.map(pdf_runner.extract_page_range, starts, stops) for text in chunk]
+
+    # Split page by page instead of joining everything into one string and re-splitting
+    rows = []
+    for text in texts:
+        if text:
+            rows.extend(text.splitlines())
+    return rows
+
+# String columns with at most this share of unique values become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# Downcast integer columns and categorize low-cardinality strings for the prompt summary.
+# Floats keep their precision: float32 would leak rounding noise into the prompt.
+# Only the summary sees these dtypes; int8 arithmetic overflows and categorical groupbys
+# add empty combinations, so the data the generated script reads keeps its parsed dtypes.
+def optimize_dtypes(df):
+    df = df.copy(deep=False)  # Replaced columns don't touch the caller's frame; nothing is duplicated
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            try:
+                num_unique = series.nunique()
+            except TypeError:
+                continue  # Unhashable values such as lists or dicts from JSON
+            if num_unique <= len(series) * CATEGORY_MAX_UNIQUE_RATIO:
+                df[col] = series.astype("category")
+    return df
+
+# Read CSV/TSV with the multi-threaded Arrow parser (pyarrow is a hard dependency)
+def read_delimited(source, **kwargs):
+    return pd.read_csv(source, engine="pyarrow", dtype_backend="pyarrow", **kwargs)
+
+# xxh3 content hash of an upload, the cache key for parsing (far faster than hashing the bytes via Streamlit)
+def hash_bytes(data):
+    return xxhash.xxh3_64(data).hexdigest()
+
+# Parse an upload straight from memory; keyed on the content hash so identical re-uploads hit the cache
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_dataframe(name, file_hash, _data):
+    ext = os.path.splitext(name)[1].lower()
+    source = io.BytesIO(_data)
+    if ext == ".csv":
+        df = read_delimited(source)
+    elif ext in (".xlsx", ".xls"):
+        df = pd.read_excel(source, sheet_name=0, engine="calamine")
+    elif ext == ".txt":
+        df = read_delimited(source, sep="\t", encoding="utf-8", on_bad_lines="skip")
+    elif ext == ".parquet":
+        df = pd.read_parquet(source, engine="pyarrow", dtype_backend="pyarrow")
+    elif ext == ".pdf":
+        df = pd.DataFrame({"Extracted_Text": extract_pdf_text(file_hash, _data)})  # Convert text into DataFrame
+    else:
+        return None
+    return df
+
+# Live API data is re-fetched at most every 5 minutes
+API_CACHE_TTL = 300
+
+# Seconds to wait for an API response
+API_TIMEOUT = 10
+
+# One pooled HTTP session per process, so keep-alive connections skip repeat TLS handshakes
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=3, backoff_factor=0.3))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Fetch live data from an API
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+def fetch_api(url):
+    response = get_session().get(url, timeout=API_TIMEOUT)
+    response.raise_for_status()
+
+    # JSON Lines goes straight through the Arrow reader without building Python dicts
+    if "ndjson" in response.headers.get("Content-Type", "") or url.endswith((".jsonl", ".ndjson")):
+        return pd.read_json(io.BytesIO(response.content), lines=True, engine="pyarrow", dtype_backend="pyarrow")
+
+    data = orjson.loads(response.content)
+
+    # Lists of records become an Arrow table in one pass and an Arrow-backed frame without copying.
+    # from_pylist takes its columns from the first record, so only uniform records go that way.
+    if isinstance(data, list) and data and all(isinstance(record, dict) for record in data) \
+            and all(record.keys() == data[0].keys() for record in data):
+        try:
+            return pa.Table.from_pylist(data).to_pandas(types_mapper=pd.ArrowDtype)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass  # Mixed-type fields: let pandas infer object columns instead
+    # Lists of records or rows; anything else (e.g. a list of numbers) is left to the DataFrame constructor
+    if isinstance(data, list) and data and all(isinstance(record, (dict, list, tuple)) for record in data):
+        return pd.DataFrame.from_records(data)
+    return pd.DataFrame(data)
@@ -0,0 +1,16 @@
+import io
+
+# PDF bytes handed to each worker process by the pool initializer
+_PDF_DATA = None
+
+# Pool initializer: keep the PDF bytes in the worker (pickled once per worker, not once per page range)
+def load_pdf(data):
+    global _PDF_DATA
+    _PDF_DATA = data
+
+# Extract text from pages [start, stop); each worker parses its own copy of the PDF
+def extract_page_range(start, stop):
+    import pdfplumber
+
+    with pdfplumber.open(io.BytesIO(_PDF_DATA)) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages[start:stop]]
@@ -0,0 +1,37 @@
+import functools
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows has no rlimits; the worker runs uncapped there
+
+# Address-space cap for the worker running generated code
+SCRIPT_MEMORY_LIMIT = 2 << 30
+
+# Modules shared with every generated script, imported once per worker
+_EXEC_GLOBALS = {}
+
+# Pool initializer: cap memory, then pay the pandas/plotly import cost once
+def preload():
+    if resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (SCRIPT_MEMORY_LIMIT, SCRIPT_MEMORY_LIMIT))
+
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    _EXEC_GLOBALS.update({"np": np, "pd": pd, "px": px, "go": go})
+
+# Parse/compile each distinct script once per worker; cached Gemini output repeats often
+@functools.lru_cache(maxsize=32)
+def compile_code(code, script_path):
+    return compile(code, script_path, "exec")
+
+# Execute generated code in a fresh namespace and return `fig` as JSON (None if it made no figure)
+def run_code(code, script_path):
+    namespace = {"__name__": "__main__", "__file__": script_path, **_EXEC_GLOBALS}
+    exec(compile_code(code, script_path), namespace)
+
+    fig = namespace.get("fig")
+    return fig.to_json() if fig is not None else None